@@ -0,0 +1,67 @@
+import atexit
+import hashlib
+import smtplib
+from functools import lru_cache
+from etl.db import get_conn
+
+SMTP_HOST = "smtp.gmail.com"
+SMTP_PORT = 587
+
+
+def hash_streams(*tagged_rows):
+    """
+    tagged_rows: (category, rows) pairs, rows being tuples of
+    (make, model, year, value)
+    """
+    # Change-detection fingerprint only, no cryptographic requirement.
+    # Rows are streamed into the digest; bytes match a "|"-joined payload.
+    h = hashlib.blake2b(digest_size=16)
+    sep = b""
+    for tag, rows in tagged_rows:
+        for r in rows:
+            h.update(sep)
+            h.update(f"{r[0]}-{r[1]}-{r[2]}-{r[3]}-{tag}".encode())
+            sep = b"|"
+    return h.hexdigest()
+
+
+def update_hash(alert_name, new_hash):
+    """Record the fingerprint of the last payload sent for an alert"""
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                INSERT INTO public.alert_state (alert_name, last_payload_hash)
+                VALUES (%s, %s)
+                ON CONFLICT (alert_name)
+                DO UPDATE SET
+                    last_payload_hash = EXCLUDED.last_payload_hash,
+                    updated_at = now()
+            """, (alert_name, new_hash))
+
+
+@lru_cache(maxsize=1)
+def _smtp(sender, password):
+    """Authenticated SMTP session, opened once and reused across sends"""
+    server = smtplib.SMTP(SMTP_HOST, SMTP_PORT)
+    server.starttls()
+    server.login(sender, password)
+    atexit.register(_quit_smtp, server)
+    return server
+
+
+def _quit_smtp(server):
+    try:
+        server.quit()
+    except smtplib.SMTPException:
+        pass
+
+
+def send_message(msg, sender, password):
+    """Send over the cached session, re-logging in if it was dropped"""
+    server = _smtp(sender, password)
+    try:
+        server.noop()
+    except smtplib.SMTPServerDisconnected:
+        _smtp.cache_clear()
+        server = _smtp(sender, password)
+    server.send_message(msg)
@@ -1,88 +1,60 @@
-from dotenv import load_dotenv
-from pathlib import Path
 import os
-
-load_dotenv(Path(__file__).resolve().parents[1] / ".env")
-DB_URL = os.getenv("SUPABASE_DB_URL")
-if not DB_URL:
-    raise RuntimeError("SUPABASE_DB_URL is NOT loaded")
-
-import hashlib
-import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
-import psycopg2
 from datetime import datetime as dt
+from etl.db import get_conn
+from etl.alert_common import hash_streams, update_hash, send_message
 
 ALERT_NAME = "critical_vehicle_risk"
 
-def get_zero_recall_vehicles():
-    with psycopg2.connect(DB_URL) as conn:
-        with conn.cursor() as cur:
-            cur.execute("""
-                SELECT
-                    MAKETXT, MODELTXT, YEARTXT,
-                    total_complaints
-                FROM vehicle_risk_scores
-                WHERE total_recalls = 0
-                  AND risk_category IN ('HIGH','CRITICAL')
-                ORDER BY total_complaints DESC
-                LIMIT 5
-            """)
-            return cur.fetchall()
-
-
-def get_ratio_critical_vehicles():
-    with psycopg2.connect(DB_URL) as conn:
-        with conn.cursor() as cur:
-            cur.execute("""
-                SELECT
-                    MAKETXT, MODELTXT, YEARTXT,
-                    ROUND((total_complaints::FLOAT / total_recalls)::NUMERIC, 1)
-                FROM vehicle_risk_scores
-                WHERE total_recalls > 0
-                  AND (total_complaints::FLOAT / total_recalls) >= 100
-                ORDER BY 4 DESC
-                LIMIT 10
-            """)
-            return cur.fetchall()
-
-def hash_payload(rows):
+def get_alert_snapshot():
     """
-    rows: list of tuples in the form
-    (make, model, year, value, category)
+    Fetch zero-recall vehicles, ratio-critical vehicles and the last
+    payload hash in a single round-trip.
     """
-    normalized = "|".join(
-        f"{r[0]}-{r[1]}-{r[2]}-{r[3]}-{r[4]}"
-        for r in rows
-    )
-    return hashlib.sha256(normalized.encode()).hexdigest()
-
-
-def get_last_hash():
-    with psycopg2.connect(DB_URL) as conn:
+    with get_conn() as conn:
         with conn.cursor() as cur:
             cur.execute("""
-                SELECT last_payload_hash
-                FROM public.alert_state
-                WHERE alert_name = %s
+                WITH zero AS (
+                    SELECT
+                        MAKETXT, MODELTXT, YEARTXT,
+                        total_complaints
+                    FROM vehicle_risk_scores
+                    WHERE total_recalls = 0
+                      AND risk_category IN ('HIGH','CRITICAL')
+                    ORDER BY total_complaints DESC
+                    LIMIT 5
+                ),
+                ratio AS (
+                    SELECT
+                        MAKETXT, MODELTXT, YEARTXT,
+                        risk_ratio AS ratio
+                    FROM vehicle_risk_scores
+                    WHERE total_recalls > 0
+                      AND risk_ratio >= 100
+                    ORDER BY risk_ratio DESC
+                    LIMIT 10
+                )
+                SELECT
+                    (SELECT COALESCE(json_agg(
+                        json_build_array(MAKETXT, MODELTXT, YEARTXT, total_complaints)
+                        ORDER BY total_complaints DESC), '[]')
+                     FROM zero),
+                    (SELECT COALESCE(json_agg(
+                        json_build_array(MAKETXT, MODELTXT, YEARTXT, ratio)
+                        ORDER BY ratio DESC), '[]')
+                     FROM ratio),
+                    (SELECT last_payload_hash
+                     FROM public.alert_state
+                     WHERE alert_name = %s)
             """, (ALERT_NAME,))
-            row = cur.fetchone()
-            return row[0] if row else None
-
+            zero_recall, ratio_risk, last_hash = cur.fetchone()
 
-def update_hash(new_hash):
-    with psycopg2.connect(DB_URL) as conn:
-        with conn.cursor() as cur:
-            cur.execute("""
-                INSERT INTO public.alert_state (alert_name, last_payload_hash)
-                VALUES (%s, %s)
-                ON CONFLICT (alert_name)
-                DO UPDATE SET
-                    last_payload_hash = EXCLUDED.last_payload_hash,
-                    updated_at = now()
-            """, (ALERT_NAME, new_hash))
-        conn.commit()
+    return (
+        [tuple(r) for r in zero_recall],
+        [tuple(r) for r in ratio_risk],
+        last_hash,
+    )
 
 def send_email(zero_recall, ratio_risk):
     sender = os.getenv("ALERT_EMAIL")
@@ -122,39 +94,29 @@ def send_email(zero_recall, ratio_risk):
     msg["Subject"] = "🚨 NHTSA Safety Alert: Vehicles Requiring Immediate Review"
     msg.attach(MIMEText(body, "plain"))
 
-    with smtplib.SMTP("smtp.gmail.com", 587) as server:
-        server.starttls()
-        server.login(sender, password)
-        server.send_message(msg)
+    send_message(msg, sender, password)
 
     print("✅ Alert email sent")
 
 
 def main():
-    zero_recall = get_zero_recall_vehicles()
-    ratio_risk = get_ratio_critical_vehicles()
+    zero_recall, ratio_risk, last_hash = get_alert_snapshot()
 
     if not zero_recall and not ratio_risk:
         print("[INFO] No critical risks detected")
         return
 
-    normalized_payload = []
-
-    for m, mo, y, c in zero_recall:
-        normalized_payload.append((m, mo, y, c, "ZERO_RECALL"))
-
-    for m, mo, y, r in ratio_risk:
-        normalized_payload.append((m, mo, y, r, "RATIO_RISK"))
-
-    current_hash = hash_payload(normalized_payload)
-    last_hash = get_last_hash()
+    current_hash = hash_streams(
+        ("ZERO_RECALL", zero_recall),
+        ("RATIO_RISK", ratio_risk),
+    )
 
     if current_hash == last_hash:
         print("[INFO] No change in alert state")
         return
 
     send_email(zero_recall, ratio_risk)
-    update_hash(current_hash)
+    update_hash(ALERT_NAME, current_hash)
     print("[SUCCESS] Alert sent and state updated")
 
 if __name__ == "__main__":
@@ -0,0 +1,37 @@
+from dotenv import load_dotenv
+from pathlib import Path
+import os
+
+load_dotenv(Path(__file__).resolve().parents[1] / ".env")
+DB_URL = os.getenv("SUPABASE_DB_URL")
+if not DB_URL:
+    raise RuntimeError("SUPABASE_DB_URL is NOT loaded")
+
+import atexit
+from contextlib import contextmanager
+from psycopg2.pool import ThreadedConnectionPool
+
+# One pool per process: every ETL step borrows from here instead of
+# paying a fresh TCP+TLS handshake to Supabase per query.
+_POOL = ThreadedConnectionPool(2, 10, DB_URL)
+atexit.register(_POOL.closeall)
+
+
+@contextmanager
+def get_conn():
+    """Borrow a pooled connection (commit on success, rollback on error)"""
+    conn = _POOL.getconn()
+    try:
+        with conn:
+            yield conn
+    finally:
+        _POOL.putconn(conn)
+
+
+def getconn():
+    """Borrow a pooled connection for longer-lived owners; pair with putconn()"""
+    return _POOL.getconn()
+
+
+def putconn(conn):
+    _POOL.putconn(conn)
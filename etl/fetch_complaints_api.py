@@ -1,23 +1,11 @@
-from dotenv import load_dotenv
-from pathlib import Path
-import os
-
-load_dotenv(Path(__file__).resolve().parents[1] / ".env")
-DB_URL = os.getenv("SUPABASE_DB_URL")
-if not DB_URL:
-    raise RuntimeError("SUPABASE_DB_URL is NOT loaded")
-
-
-import json
-import requests
-import psycopg2
-from time import sleep
-from etl.state_manager import StateManager
+from psycopg2.extras import execute_values
+from etl.db import get_conn
+from concurrent.futures import ThreadPoolExecutor
+from etl.http_client import throttled_get, MAX_WORKERS
 
 COMPLAINT_API = "https://api.nhtsa.gov/complaints/complaintsByVehicle"
 TIMEOUT = 20
 MAX_VEHICLES = 50          # safety cap
-REQUEST_DELAY = 0.05
 
 # =========================
 # API FETCH
@@ -25,7 +13,7 @@ REQUEST_DELAY = 0.05
 def fetch_complaints(make, model, year):
     """Fetch complaints from NHTSA API for one vehicle"""
     try:
-        resp = requests.get(
+        resp = throttled_get(
             COMPLAINT_API,
             params={
                 "make": make,
@@ -44,15 +32,11 @@ def fetch_complaints(make, model, year):
 # MAIN LOADER
 # =========================
 def load_complaints():
-    sm = StateManager()
-
-    # Previously ingested ODI numbers (dedupe)
-    raw = sm.get("seen_odi_numbers")
-    seen_odis = set(json.loads(raw)) if raw else set()
+    # Cross-run dedupe is flat_cmpl_cmplid_unique + ON CONFLICT; this set
+    # only drops repeats within a single run
+    seen_odis = set()
 
-    print(f"[INFO] Seen ODIs: {len(seen_odis)}")
-
-    with psycopg2.connect(DB_URL) as conn:
+    with get_conn() as conn:
         with conn.cursor() as cur:
             cur.execute("""
                 SELECT MAKETXT, MODELTXT, YEARTXT
@@ -68,59 +52,67 @@ def load_complaints():
 
         rows_to_insert = []
 
-        for idx, (make, model, year) in enumerate(vehicles, start=1):
-            print(f"[{idx}/{len(vehicles)}] {make} {model} {year}")
-
-            complaints = fetch_complaints(make, model, year)
-            sleep(REQUEST_DELAY)
-
-            for c in complaints:
-                odi = str(c.get("odiNumber"))
-                if not odi or odi in seen_odis:
-                    continue
-
-                rows_to_insert.append((
-                    odi,
-                    make,
-                    model,
-                    year,
-                    'Y' if c.get("crash") else 'N',
-                    'Y' if c.get("fire") else 'N',
-                    c.get("numberOfInjuries", 0),
-                    c.get("numberOfDeaths", 0),
-                    c.get("components"),
-                    c.get("summary"),
-                    c.get("dateComplaintFiled"),
-                ))
-
-                seen_odis.add(odi)
+        # I/O-bound: fetch concurrently, dedupe serially in input order
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as ex:
+            results = ex.map(lambda v: fetch_complaints(*v), vehicles)
+
+            for idx, ((make, model, year), complaints) in enumerate(
+                zip(vehicles, results), start=1
+            ):
+                print(f"[{idx}/{len(vehicles)}] {make} {model} {year}")
+
+                # Key each complaint once, then filter in bulk
+                keyed = {
+                    str(c["odiNumber"]): c
+                    for c in complaints if c.get("odiNumber")
+                }
+                new = [(odi, c) for odi, c in keyed.items() if odi not in seen_odis]
+
+                rows_to_insert.extend(
+                    (
+                        odi,
+                        make,
+                        model,
+                        year,
+                        'Y' if c.get("crash") else 'N',
+                        'Y' if c.get("fire") else 'N',
+                        c.get("numberOfInjuries", 0),
+                        c.get("numberOfDeaths", 0),
+                        c.get("components"),
+                        c.get("summary"),
+                        c.get("dateComplaintFiled"),
+                    )
+                    for odi, c in new
+                )
+                seen_odis.update(odi for odi, _ in new)
 
         if not rows_to_insert:
             print("[INFO] No new complaints found")
             return
 
-        print(f"[INFO] Inserting {len(rows_to_insert)} new complaints")
+        print(f"[INFO] Inserting up to {len(rows_to_insert)} complaints")
 
-        # 🚀 BULK INSERT
+        # 🚀 BULK INSERT (multi-row VALUES, deduped by flat_cmpl_cmplid_unique)
         with conn.cursor() as cur:
-            cur.executemany("""
+            inserted = execute_values(cur, """
                 INSERT INTO flat_cmpl (
                     cmplid, maketxt, modeltxt, yeartxt,
                     crash, fire, injured, deaths,
                     compdesc, cdescr, ldate
                 )
-                SELECT %s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s
-                WHERE NOT EXISTS (
-                    SELECT 1 FROM flat_cmpl WHERE cmplid = %s
+                VALUES %s
+                ON CONFLICT (cmplid) DO NOTHING
+                RETURNING cmplid
+            """, rows_to_insert, page_size=500, fetch=True)
+
+            if inserted:
+                cur.execute(
+                    "REFRESH MATERIALIZED VIEW CONCURRENTLY top_complaint_vehicles_mv"
                 )
-            """, [row + (row[0],) for row in rows_to_insert])
 
         conn.commit()
 
-    sm.set("seen_odi_numbers", json.dumps(list(seen_odis)))
-    sm.close()
-
-    print("[SUCCESS] Complaint ingestion complete")
+    print(f"[SUCCESS] Complaint ingestion complete ({len(inserted)} new)")
 
 # =========================
 # ENTRY POINT
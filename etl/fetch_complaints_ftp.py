@@ -1,18 +1,18 @@
-from dotenv import load_dotenv
-from pathlib import Path
 import os
-
-load_dotenv(Path(__file__).resolve().parents[1] / ".env")
-DB_URL = os.getenv("SUPABASE_DB_URL")
-if not DB_URL:
-    raise RuntimeError("SUPABASE_DB_URL is NOT loaded")
-
-import psycopg2
+import io
 import pandas as pd
 from ftplib import FTP
+from etl.db import get_conn
 
 DATA_DIR = "data"
 FILENAME = "flat_cmpl.txt"
+COPY_CHUNK_ROWS = 100_000
+
+COLUMNS = [
+    "CMPLID", "MAKETXT", "MODELTXT", "YEARTXT",
+    "CRASH", "FIRE", "INJURED", "DEATHS",
+    "COMPDESC", "LDATE",
+]
 
 def download_complaint_flatfile():
     ftp = FTP("ftp.nhtsa.dot.gov")
@@ -29,43 +29,60 @@ def download_complaint_flatfile():
     print(f"[SUCCESS] Downloaded {FILENAME}")
 
 def load_complaints_to_db():
+    # Typed, column-restricted read: no low_memory double pass and no
+    # float-ified IDs/years
     df = pd.read_csv(
         f"{DATA_DIR}/{FILENAME}",
         sep="|",
         encoding="latin1",
-        low_memory=False
+        usecols=COLUMNS,
+        dtype={
+            **{c: "string" for c in COLUMNS},
+            "INJURED": "Int32",
+            "DEATHS": "Int32",
+        }
     )
 
     df = df.dropna(subset=["CMPLID"])
+    df["INJURED"] = df["INJURED"].fillna(0).astype("int32")
+    df["DEATHS"] = df["DEATHS"].fillna(0).astype("int32")
+    cols = ", ".join(COLUMNS)
 
-    insert_sql = """
-        INSERT INTO flat_cmpl (
-            CMPLID, MAKETXT, MODELTXT, YEARTXT,
-            CRASH, FIRE, INJURED, DEATHS,
-            COMPDESC, LDATE
-        )
-        VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)
-        ON CONFLICT (CMPLID) DO NOTHING
-    """
-
-    with psycopg2.connect(DB_URL) as conn:
+    with get_conn() as conn:
         with conn.cursor() as cur:
-            for _,r in df.iterrows():
-                cur.execute(insert_sql, (
-                    r["CMPLID"],
-                    r["MAKETXT"],
-                    r["MODELTXT"],
-                    r["YEARTXT"],
-                    r["CRASH"],
-                    r["FIRE"],
-                    r["INJURED"] or 0,
-                    r["DEATHS"] or 0,
-                    r["COMPDESC"],
-                    r["LDATE"]
-                ))
+            # Stream the file through COPY into a staging table, then
+            # dedupe into flat_cmpl with one INSERT ... SELECT
+            cur.execute("""
+                CREATE TEMP TABLE stg_cmpl (LIKE flat_cmpl INCLUDING DEFAULTS)
+                ON COMMIT DROP
+            """)
+            for start in range(0, len(df), COPY_CHUNK_ROWS):
+                buf = io.StringIO()
+                df.iloc[start:start + COPY_CHUNK_ROWS].to_csv(
+                    buf, sep="\t", index=False, header=False, columns=COLUMNS
+                )
+                buf.seek(0)
+                cur.copy_expert(
+                    f"COPY stg_cmpl ({cols}) FROM STDIN "
+                    "WITH (FORMAT csv, DELIMITER E'\\t')",
+                    buf
+                )
+
+            cur.execute(f"""
+                INSERT INTO flat_cmpl ({cols})
+                SELECT {cols}
+                FROM stg_cmpl
+                ON CONFLICT (CMPLID) DO NOTHING
+            """)
+            inserted = cur.rowcount
+
+            if inserted:
+                cur.execute(
+                    "REFRESH MATERIALIZED VIEW CONCURRENTLY top_complaint_vehicles_mv"
+                )
         conn.commit()
 
-    print("[SUCCESS] Complaints loaded with deduplication")
+    print(f"[SUCCESS] Loaded {inserted} new complaints with deduplication")
 
 def main():
     download_complaint_flatfile()
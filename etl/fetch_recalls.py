@@ -1,102 +1,151 @@
-from dotenv import load_dotenv
-from pathlib import Path
-import os
-
-load_dotenv(Path(__file__).resolve().parents[1] / ".env")
-DB_URL = os.getenv("SUPABASE_DB_URL")
-if not DB_URL:
-    raise RuntimeError("SUPABASE_DB_URL is NOT loaded")
-
-import requests
-import psycopg2
 from datetime import datetime as dt
+from etl.db import get_conn
+from etl.http_client import throttled_get, MAX_WORKERS
 from etl.state_manager import StateManager
+from concurrent.futures import ThreadPoolExecutor
 import json
-from time import sleep
 
 RECALL_API = "https://api.nhtsa.gov/recalls/recallsByVehicle"
 REQUEST_TIMEOUT = 20
-MAX_RETRIES = 3
-
-def safe_get(url, params):
-    """HTTP GET with retries"""
-    for attempt in range(1, MAX_RETRIES + 1):
-        try:
-            r = requests.get(url, params=params, timeout=REQUEST_TIMEOUT)
-            if r.status_code == 200:
-                return r.json()
-            else:
-                print(f"[WARN] Status {r.status_code}, retry {attempt}")
-        except Exception as e:
-            print(f"[WARN] Request failed ({attempt}): {e}")
-        sleep(2)
-    return None
+
+def safe_get(url, params, headers=None):
+    """
+    HTTP GET (retries and backoff handled by the shared session).
+    Returns (status, json, response headers); status is None on failure.
+    """
+    try:
+        r = throttled_get(url, params=params, headers=headers, timeout=REQUEST_TIMEOUT)
+        if r.status_code == 304:
+            return 304, None, r.headers
+        if r.status_code == 200:
+            return 200, r.json(), r.headers
+        print(f"[WARN] Status {r.status_code} for {params}")
+    except Exception as e:
+        print(f"[WARN] Request failed for {params}: {e}")
+    return None, None, {}
 
 
 def get_top_complaint_vehicles(limit=20):
     """Get vehicles with highest complaints from database"""
-    with psycopg2.connect(DB_URL) as conn:
-        with conn.cursor() as cursor:
+    with get_conn() as conn:
+        # Named (server-side) cursor: rows stream in itersize batches
+        # instead of being buffered whole by libpq
+        with conn.cursor(name="top_vehicles") as cursor:
+            cursor.itersize = 100
+            # Aggregated once per complaint ingest (see schema.sql)
             cursor.execute("""
-                SELECT DISTINCT
-                    MAKETXT AS make,
-                    MODELTXT AS model,
-                    YEARTXT AS year,
-                    COUNT(*) AS complaint_count
-                FROM flat_cmpl
-                WHERE YEARTXT BETWEEN '2015' AND '2024'
-                  AND MAKETXT NOT IN ('UNKNOWN', 'FIRESTONE', 'GOODYEAR')
-                  AND MODELTXT != 'UNKNOWN'
-                GROUP BY MAKETXT, MODELTXT, YEARTXT
-                HAVING COUNT(*) > 50
+                SELECT make, model, year, complaint_count
+                FROM top_complaint_vehicles_mv
                 ORDER BY complaint_count DESC
                 LIMIT %s
             """, (limit,))
-            rows = cursor.fetchall()
+            return [
+                {"make": row[0], "model": row[1], "year": row[2], "complaint_count": row[3]}
+                for row in cursor
+            ]
+
 
-    return [
-        {"make": row[0], "model": row[1], "year": row[2], "complaint_count": row[3]}
-        for row in rows
-    ]
+def vehicle_key(vehicle):
+    return f"{vehicle['make']}|{vehicle['model']}|{vehicle['year']}"
 
 
-def fetch_recalls_for_vehicle(vehicle):
-    data = safe_get(RECALL_API, {
+def fetch_recalls_for_vehicle(vehicle, validators=None):
+    """
+    Conditional GET: returns (recalls, validators). A 304 Not Modified
+    means nothing new, so the body is never downloaded or parsed.
+    """
+    validators = validators or {}
+    headers = {}
+    if validators.get("etag"):
+        headers["If-None-Match"] = validators["etag"]
+    if validators.get("last_modified"):
+        headers["If-Modified-Since"] = validators["last_modified"]
+
+    status, data, resp_headers = safe_get(RECALL_API, {
         "make": vehicle["make"],
         "model": vehicle["model"],
         "modelYear": vehicle["year"]
-    })
-    return data.get("results", []) if data else []
+    }, headers)
+
+    if status == 304:
+        print(f"[INFO] No recall changes for {vehicle_key(vehicle)} (304)")
+        return [], validators
+    if status != 200:
+        # the old validators still describe what is already loaded
+        print(f"[WARN] Recall fetch failed for {vehicle_key(vehicle)}")
+        return [], validators
+
+    fresh = {
+        "etag": resp_headers.get("ETag"),
+        "last_modified": resp_headers.get("Last-Modified"),
+    }
+    return data.get("results", []), {k: v for k, v in fresh.items() if v}
 
 
 def fetch_new_recalls():
     sm = StateManager()
-    seen = set(json.loads(sm.get("seen_campaign_numbers") or "[]"))
+    # ETag / Last-Modified per vehicle, bounded by the top-vehicle list
+    http_cache = json.loads(sm.get("recall_http_validators") or "{}")
 
     vehicles = get_top_complaint_vehicles()
-    new_recalls = []
 
-    for v in vehicles:
-        recalls = fetch_recalls_for_vehicle(v)
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as ex:
+        results = list(ex.map(
+            lambda v: fetch_recalls_for_vehicle(v, http_cache.get(vehicle_key(v))),
+            vehicles
+        ))
+
+    # Not saved here: a 304 next run would hide these recalls for good if
+    # they never reach flat_rcl; see save_http_validators
+    validators = {
+        vehicle_key(v): val for v, (_, val) in zip(vehicles, results) if val
+    }
+
+    # First sighting of each campaign in this run
+    candidates = {}
+    for v, (recalls, _) in zip(vehicles, results):
         for r in recalls:
             campaign = r.get("NHTSACampaignNumber")
-            if campaign and campaign not in seen:
+            if campaign and campaign not in candidates:
+                candidates[campaign] = (v, r)
+
+    new_recalls = []
+    if candidates:
+        # Read-only probe: insert_recalls marks campaigns seen in the same
+        # transaction that loads them, so a failed load is retried next run
+        with get_conn() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "SELECT campaign_number FROM seen_campaigns WHERE campaign_number = ANY(%s)",
+                    (list(candidates),)
+                )
+                seen = {row[0] for row in cur.fetchall()}
+
+        for campaign, (v, r) in candidates.items():
+            if campaign not in seen:
                 new_recalls.append(r)
-                seen.add(campaign)
                 print(f"[NEW] {campaign} ({v['make']} {v['model']} {v['year']})")
 
     if new_recalls:
-        sm.set("seen_campaign_numbers", json.dumps(list(seen)))
         sm.set("last_recall_fetch", dt.utcnow().isoformat())
         sm.set("total_recalls_loaded",
                int(sm.get("total_recalls_loaded") or 0) + len(new_recalls))
 
     sm.close()
-    return new_recalls
+    return new_recalls, validators
+
+
+def save_http_validators(validators):
+    """Store ETag / Last-Modified per vehicle; call only after the recalls are loaded"""
+    sm = StateManager()
+    if validators != json.loads(sm.get("recall_http_validators") or "{}"):
+        sm.set("recall_http_validators", json.dumps(validators))
+    sm.close()
 
 
 if __name__ == "__main__":
-    recalls = fetch_new_recalls()
+    # Inspection only: recalls are not loaded, so the validators are not saved
+    recalls, _ = fetch_new_recalls()
 
     # Save to file for inspection
     if recalls:
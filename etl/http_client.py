@@ -0,0 +1,48 @@
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+MAX_WORKERS = 10           # concurrent NHTSA API requests
+REQUEST_DELAY = 0.05       # min spacing between requests, across all threads
+
+# Shared keep-alive session; pool sized above MAX_WORKERS so no thread
+# has to open a throwaway connection. Transient failures are retried by
+# urllib3 with exponential backoff.
+SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=16,
+    max_retries=Retry(
+        total=3,
+        backoff_factor=0.5,
+        status_forcelist=[429, 500, 502, 503, 504],
+    ),
+))
+
+
+class RateLimiter:
+    """Space out calls from any number of threads by a fixed interval"""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._next = 0.0
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+
+_LIMITER = RateLimiter(REQUEST_DELAY)
+
+
+def throttled_get(url, **kwargs):
+    """GET through the shared session, politely rate-limited"""
+    _LIMITER.wait()
+    return SESSION.get(url, **kwargs)
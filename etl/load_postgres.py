@@ -1,226 +1,204 @@
-from dotenv import load_dotenv
-from pathlib import Path
-import os
+import psycopg2
+from psycopg2.extras import execute_values
+from datetime import datetime
+from itertools import chain, islice
+from concurrent.futures import ThreadPoolExecutor
+from etl.db import get_conn
+from etl.state_manager import StateManager
+
+BATCH_SIZE = 1000          # recalls per batch; one INSERT statement each
+
+RECALL_COLUMNS = (
+    "CAMPNO, MAKETXT, MODELTXT, YEARTXT, "
+    "COMPNAME, DESC_DEFECT, RCDATE, POTAFF"
+)
+
+# Shared 2020-2024 complaint base; rebuilt before the views that read it
+BASE_VIEW = "cmpl_2020_2024"
+
+# Materialized views defined in sql/schema.sql, in dependency order: each
+# stage only reads views rebuilt by an earlier one, so the views within a
+# stage refresh in parallel on separate pooled connections
+REFRESH_STAGES = (
+    (BASE_VIEW, "vehicle_risk_scores", "top_recalled_vehicles"),
+    ("component_analysis", "yearly_trends", "repeat_offenders", "component_cost_impact"),
+    ("etl_metrics",),          # counts over vehicle_risk_scores
+)
+REFRESH_WORKERS = 4
+# work_mem is per sort/hash node per backend, so the 256MB a serial
+# refresh had is split across the parallel refreshes
+REFRESH_WORK_MEM_MB = 256 // REFRESH_WORKERS
+
+INSERT_RECALLS_SQL = f"""
+    INSERT INTO flat_rcl ({RECALL_COLUMNS})
+    VALUES %s
+    ON CONFLICT (CAMPNO) DO NOTHING
+    RETURNING CAMPNO
+"""
+
+
+def _recall_row(recall):
+    return (
+        recall.get('NHTSACampaignNumber', 'UNKNOWN'),
+        recall.get('Make', 'UNKNOWN'),
+        recall.get('Model', 'UNKNOWN'),
+        str(recall.get('ModelYear', '9999')),
+        recall.get('Component', ''),
+        recall.get('Summary', ''),
+        recall.get('ReportReceivedDate', ''),
+        recall.get('PotentialUnitsAffected', 0)
+    )
 
-load_dotenv(Path(__file__).resolve().parents[1] / ".env")
-DB_URL = os.getenv("SUPABASE_DB_URL")
-if not DB_URL:
-    raise RuntimeError("SUPABASE_DB_URL is NOT loaded")
 
-import psycopg2
+def _insert_rows_individually(cursor, rows):
+    """Slow path: isolate bad rows behind per-row savepoints"""
+    inserted = 0
+    for row in rows:
+        cursor.execute("SAVEPOINT recall_row")
+        try:
+            inserted += len(execute_values(cursor, INSERT_RECALLS_SQL, [row], fetch=True))
+            cursor.execute("RELEASE SAVEPOINT recall_row")
+        except psycopg2.Error as e:
+            cursor.execute("ROLLBACK TO SAVEPOINT recall_row")
+            print(f"[WARN] Failed to insert recall {row[0]}: {e}")
+    return inserted
+
+
+def _batches(iterable, size):
+    it = iter(iterable)
+    while batch := list(islice(it, size)):
+        yield batch
+
+
+def _insert_batch(cursor, rows):
+    """Load one {CAMPNO: row} batch, skipping campaigns already in flat_rcl"""
+    # Drop campaigns already loaded before sending anything, so the
+    # insert only touches genuinely new rows; ON CONFLICT stays as
+    # a guard against concurrent loads
+    cursor.execute(
+        "SELECT CAMPNO FROM flat_rcl WHERE CAMPNO = ANY(%s)",
+        (list(rows),)
+    )
+    for (campno,) in cursor.fetchall():
+        del rows[campno]
+    rows = list(rows.values())
+    if not rows:
+        return 0
+
+    # Fast path: one multi-row VALUES insert; fall back row-by-row on error
+    cursor.execute("SAVEPOINT recall_batch")
+    try:
+        inserted = len(execute_values(cursor, INSERT_RECALLS_SQL, rows, page_size=BATCH_SIZE, fetch=True))
+        cursor.execute("RELEASE SAVEPOINT recall_batch")
+    except psycopg2.Error as e:
+        cursor.execute("ROLLBACK TO SAVEPOINT recall_batch")
+        print(f"[WARN] Batch insert failed ({e}), retrying row by row")
+        inserted = _insert_rows_individually(cursor, rows)
+    return inserted
+
 
 def insert_recalls(recalls):
-    """Insert recalls with ON CONFLICT DO NOTHING (idempotent)"""
-    if not recalls:
+    """Insert recalls with ON CONFLICT DO NOTHING (idempotent)
+
+    Accepts any iterable (including a generator) and loads it BATCH_SIZE
+    recalls at a time, so only one batch of rows is held in memory.
+    """
+    batches = _batches(recalls, BATCH_SIZE)
+    first = next(batches, None)
+    if first is None:
         print("[INFO] No recalls to insert")
         return 0
 
-    conn = psycopg2.connect(DB_URL)
-    cursor = conn.cursor()
-
     inserted = 0
-    for recall in recalls:
-        try:
-            cursor.execute("""
-                INSERT INTO flat_rcl (
-                    CAMPNO, MAKETXT, MODELTXT, YEARTXT,
-                    COMPNAME, DESC_DEFECT, RCDATE, POTAFF
-                )
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-                ON CONFLICT (CAMPNO) DO NOTHING
-            """, (
-                recall.get('NHTSACampaignNumber', 'UNKNOWN'),
-                recall.get('Make', 'UNKNOWN'),
-                recall.get('Model', 'UNKNOWN'),
-                str(recall.get('ModelYear', '9999')),
-                recall.get('Component', ''),
-                recall.get('Summary', ''),
-                recall.get('ReportReceivedDate', ''),
-                recall.get('PotentialUnitsAffected', 0)
-            ))
-            if cursor.rowcount > 0:
-                inserted += 1
-        except Exception as e:
-            print(f"[WARN] Failed to insert recall: {e}")
-
-    conn.commit()
-    cursor.close()
-    conn.close()
+    seen = set()
+    with get_conn() as conn:
+        with conn.cursor() as cursor:
+            for batch in chain([first], batches):
+                # One row per campaign (the API repeats campaigns across queries)
+                rows = {}
+                for r in batch:
+                    row = _recall_row(r)
+                    if row[0] not in seen:
+                        rows[row[0]] = row
+                seen.update(rows)
+                campaigns = list(rows)
+                inserted += _insert_batch(cursor, rows)
+                # mark only what actually reached flat_rcl, in this same
+                # transaction, so fetch_new_recalls offers the rest again
+                cursor.execute("""
+                    INSERT INTO seen_campaigns (campaign_number)
+                    SELECT CAMPNO FROM flat_rcl WHERE CAMPNO = ANY(%s)
+                    ON CONFLICT DO NOTHING
+                """, (campaigns,))
 
     print(f"[SUCCESS] Inserted {inserted} new recalls")
     return inserted
 
 
-def refresh_analytical_tables():
-    conn = psycopg2.connect(DB_URL)
-    cursor = conn.cursor()
-
-    # 1. Vehicle risk scores
-    print("[INFO] Refreshing vehicle_risk_scores...")
-    cursor.execute("DROP TABLE IF EXISTS vehicle_risk_scores;")
-    cursor.execute("""
-        CREATE TABLE vehicle_risk_scores AS
-        SELECT 
-            MAKETXT, MODELTXT, YEARTXT,
-            total_complaints, total_recalls,
-            (total_complaints::FLOAT / NULLIF(total_recalls, 0)) AS risk_ratio,
-            CASE 
-                WHEN total_recalls = 0 AND total_complaints > 500 THEN 'CRITICAL'
-                WHEN total_recalls = 0 AND total_complaints > 200 THEN 'HIGH'
-                WHEN total_complaints > total_recalls * 10 THEN 'MEDIUM'
-                ELSE 'LOW'
-            END AS risk_category
-        FROM vehicle_risk_summary
-        WHERE YEARTXT BETWEEN '2020' AND '2024'
-          AND total_complaints > 50
-        ORDER BY total_complaints DESC;
-    """)
-
-    # 2. Component Pareto
-    print("[INFO] Refreshing component_analysis...")
-    cursor.execute("DROP TABLE IF EXISTS component_analysis;")
-    cursor.execute("""
-        CREATE TABLE component_analysis AS
-        SELECT
-            COMPDESC,
-            COUNT(*) AS total_complaints,
-            SUM(CASE WHEN CRASH = 'Y' THEN 1 ELSE 0 END) AS crash_related,
-            SUM(CASE WHEN FIRE = 'Y' THEN 1 ELSE 0 END) AS fire_related,
-            SUM(INJURED) AS total_injuries,
-            SUM(DEATHS) AS total_deaths
-        FROM flat_cmpl
-        WHERE YEARTXT BETWEEN '2020' AND '2024'
-          AND MAKETXT NOT IN ('UNKNOWN', 'FIRESTONE', 'GOODYEAR')
-        GROUP BY COMPDESC
-        ORDER BY total_complaints DESC
-        LIMIT 50;
-    """)
-
-    # 3. Time Series by Year
-    print("[INFO] Refreshing yearly_trends...")
-    cursor.execute("DROP TABLE IF EXISTS yearly_trends;")
-    cursor.execute("""
-        CREATE TABLE yearly_trends AS
-        SELECT
-            YEARTXT AS year,
-            COUNT(*) AS total_complaints,
-            SUM(CASE WHEN CRASH = 'Y' THEN 1 ELSE 0 END) AS crashes,
-            SUM(CASE WHEN FIRE = 'Y' THEN 1 ELSE 0 END) AS fires,
-            SUM(INJURED) AS injuries,
-            SUM(DEATHS) AS deaths
-        FROM flat_cmpl
-        WHERE YEARTXT BETWEEN '2020' AND '2024'
-        GROUP BY YEARTXT
-        ORDER BY YEARTXT;
-    """)
-
-    # 4. Top Recalled Vehicles
-    print("[INFO] Refreshing top_recalled_vehicles...")
-    cursor.execute("DROP TABLE IF EXISTS top_recalled_vehicles;")
-    cursor.execute("""
-        CREATE TABLE top_recalled_vehicles AS
-        SELECT
-            MAKETXT,
-            MODELTXT,
-            YEARTXT,
-            COUNT(*) AS recall_count,
-            SUM(POTAFF) AS total_units_affected
-        FROM flat_rcl
-        WHERE YEARTXT BETWEEN '2020' AND '2024'
-        GROUP BY MAKETXT, MODELTXT, YEARTXT
-        HAVING COUNT(*) > 1
-        ORDER BY recall_count DESC
-        LIMIT 100;
-    """)
-
-    # 5. Repeat Offender Vehicles (persistent top-complaint models)
-    print("[INFO] Refreshing repeat_offenders...")
-    cursor.execute("DROP TABLE IF EXISTS repeat_offenders;")
-    cursor.execute("""
-        CREATE TABLE repeat_offenders AS
-        WITH yearly_aggregates AS (
-            SELECT
-                MAKETXT,
-                MODELTXT,
-                YEARTXT,
-                COUNT(*) AS complaints
-            FROM flat_cmpl
-            WHERE YEARTXT BETWEEN '2020' AND '2024'
-            GROUP BY MAKETXT, MODELTXT, YEARTXT
-        ),
-        yearly_rankings AS (
-            SELECT
-                MAKETXT,
-                MODELTXT,
-                YEARTXT,
-                complaints,
-                ROW_NUMBER() OVER (
-                    PARTITION BY YEARTXT
-                    ORDER BY complaints DESC
-                ) AS rank_in_year
-            FROM yearly_aggregates
-        )
-        SELECT
-            MAKETXT,
-            MODELTXT,
-            COUNT(DISTINCT YEARTXT) AS years_in_top10,
-            SUM(complaints) AS total_complaints,
-            STRING_AGG(YEARTXT, ',' ORDER BY YEARTXT) AS problem_years
-        FROM yearly_rankings
-        WHERE rank_in_year <= 10
-        GROUP BY MAKETXT, MODELTXT
-        HAVING COUNT(DISTINCT YEARTXT) >= 3
-        ORDER BY years_in_top10 DESC, total_complaints DESC;
-    """)
-
-    # 6. Component Cost Impact (economic + injury burden)
-    print("[INFO] Refreshing component_cost_impact")
-    cursor.execute("DROP TABLE IF EXISTS component_cost_impact;")
-    cursor.execute("""
-        CREATE TABLE component_cost_impact AS
-        WITH component_costs AS (
-            SELECT
-                COMPDESC,
-                COUNT(*) AS total_complaints,
-                SUM(CASE WHEN CRASH = 'Y' THEN 1 ELSE 0 END) AS crash_count,
-                SUM(INJURED) AS total_injuries,
-                (
-                    COUNT(*) * 5000
-                    + SUM(CASE WHEN CRASH = 'Y' THEN 1 ELSE 0 END) * 50000
-                    + SUM(INJURED) * 100000
-                )::BIGINT AS estimated_cost
-            FROM flat_cmpl
-            WHERE YEARTXT BETWEEN '2020' AND '2024'
-                AND MAKETXT NOT IN ('UNKNOWN', 'FIRESTONE', 'GOODYEAR')
-            GROUP BY COMPDESC
-        )
-        SELECT
-            COMPDESC,
-            total_complaints,
-            crash_count,
-            total_injuries,
-            estimated_cost,
-            (estimated_cost * 0.10)::BIGINT AS savings_if_reduced_10pct
-        FROM component_costs
-        ORDER BY estimated_cost DESC
-        LIMIT 50;
-    """)
-
-    conn.commit()
-
-    # Get counts
-    cursor.execute("SELECT COUNT(*) FROM vehicle_risk_scores;")
-    risk_count = cursor.fetchone()[0]
-    cursor.execute("SELECT COUNT(*) FROM component_analysis;")
-    comp_count = cursor.fetchone()[0]
-    cursor.execute("SELECT COUNT(*) FROM yearly_trends;")
-    trend_count = cursor.fetchone()[0]
-    cursor.execute("SELECT COUNT(*) FROM top_recalled_vehicles;")
-    recall_count = cursor.fetchone()[0]
-    cursor.execute("SELECT COUNT(*) FROM repeat_offenders;")
-    repeat_count = cursor.fetchone()[0]
-    cursor.execute("SELECT COUNT(*) FROM component_cost_impact;")
-    cost_count = cursor.fetchone()[0]
+def _refresh_view(view):
+    """Rebuild one materialized view in its own transaction"""
+    print(f"[INFO] Refreshing {view}...")
+    with get_conn() as conn:
+        with conn.cursor() as cursor:
+            # commit need not wait for the WAL flush, and the GROUP BY/sort
+            # steps get room to stay in memory
+            cursor.execute(f"""
+                SET LOCAL synchronous_commit = off;
+                SET LOCAL work_mem = '{REFRESH_WORK_MEM_MB}MB';
+            """)
+            if view == BASE_VIEW:
+                # only other views read the base, so no need for CONCURRENTLY
+                cursor.execute(f"REFRESH MATERIALIZED VIEW {view};")
+                cursor.execute(f"ANALYZE {view};")
+            else:
+                # CONCURRENTLY keeps the dashboard reading the previous snapshot
+                cursor.execute(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {view};")
+
+
+def refresh_analytical_tables(force=False):
+    sm = StateManager()
+    try:
+        with get_conn() as conn:
+            with conn.cursor() as cursor:
+                # Skip the full rebuild when nothing was loaded since the last one
+                # (index-backed MAX over the loaded_at watermark columns)
+                cursor.execute("""
+                    SELECT GREATEST(
+                        (SELECT MAX(loaded_at) FROM flat_cmpl),
+                        (SELECT MAX(loaded_at) FROM flat_rcl)
+                    );
+                """)
+                latest_load = cursor.fetchone()[0]
+
+        last_refresh = sm.get("last_analytics_refresh")
+        if (not force and latest_load and last_refresh
+                and latest_load <= datetime.fromisoformat(last_refresh)):
+            print("[INFO] No new complaints or recalls since last refresh, skipping")
+            return
+
+        with ThreadPoolExecutor(max_workers=REFRESH_WORKERS) as ex:
+            for stage in REFRESH_STAGES:
+                list(ex.map(_refresh_view, stage))
+
+        if latest_load:
+            sm.set("last_analytics_refresh", latest_load.isoformat())
+
+        # Get counts (one round-trip)
+        with get_conn() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    SELECT
+                        (SELECT COUNT(*) FROM vehicle_risk_scores) AS risk,
+                        (SELECT COUNT(*) FROM component_analysis) AS comp,
+                        (SELECT COUNT(*) FROM yearly_trends) AS trend,
+                        (SELECT COUNT(*) FROM top_recalled_vehicles) AS rec,
+                        (SELECT COUNT(*) FROM repeat_offenders) AS rep,
+                        (SELECT COUNT(*) FROM component_cost_impact) AS cost;
+                """)
+                (risk_count, comp_count, trend_count,
+                 recall_count, repeat_count, cost_count) = cursor.fetchone()
+    finally:
+        sm.close()
 
     print(
         f"[SUCCESS] Refreshed: "
@@ -232,9 +210,6 @@ def refresh_analytical_tables():
         f"{cost_count} cost-impact components"
     )
 
-    cursor.close()
-    conn.close()
-
 
 if __name__ == "__main__":
     # Test with an empty list
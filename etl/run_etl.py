@@ -1,10 +1,11 @@
-from etl.fetch_recalls import fetch_new_recalls
+from etl.fetch_recalls import fetch_new_recalls, save_http_validators
 from etl.load_postgres import insert_recalls, refresh_analytical_tables
+import sys
 from datetime import datetime
 from etl.fetch_complaints_api import load_complaints
 from etl.critical_vehicle_alert import main as run_alerts
 
-def main():
+def main(force_refresh=False):
     print("=" * 60)
     print(f"NHTSA ETL Pipeline started at {datetime.now()}")
     print("=" * 60)
@@ -15,15 +16,17 @@ def main():
 
     # Step 2: Fetch recalls
     print("\n[STEP 2] Fetching recalls from NHTSA API...")
-    recalls = fetch_new_recalls()
+    recalls, validators = fetch_new_recalls()
 
     # Step 3: Load recalls
     print(f"\n[STEP 3] Loading {len(recalls)} recalls into database...")
     insert_recalls(recalls)
+    # only now is it safe to let the next run skip unchanged vehicles
+    save_http_validators(validators)
 
     # Step 4: Refresh analytics
     print("\n[STEP 4] Refreshing analytical tables...")
-    refresh_analytical_tables()
+    refresh_analytical_tables(force=force_refresh)
 
     # Step 5: Alert on critical vehicles
     print("\n[STEP 5] Running critical vehicle alerts...")
@@ -34,4 +37,5 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    # --force-refresh rebuilds the views even if nothing new was loaded
+    main(force_refresh="--force-refresh" in sys.argv[1:])
@@ -1,24 +1,21 @@
-from dotenv import load_dotenv
-from pathlib import Path
-import os
-
-load_dotenv(Path(__file__).resolve().parents[1] / ".env")
-DB_URL = os.getenv("SUPABASE_DB_URL")
-if not DB_URL:
-    raise RuntimeError("SUPABASE_DB_URL not loaded")
-
-import psycopg2
+from etl.db import getconn, putconn
 
 class StateManager:
     """Database-backed ETL state (replaces state.json)"""
 
     def __init__(self):
-        self.conn = psycopg2.connect(DB_URL)
+        # Each get/set is its own statement: autocommit skips the separate
+        # COMMIT round-trip
+        self.conn = getconn()
+        self.conn.autocommit = True
 
     def get(self, key):
         """Get state value"""
         cursor = self.conn.cursor()
-        cursor.execute("SELECT value FROM public.etl_state WHERE key = %s", (key,))
+        cursor.execute(
+            "SELECT value FROM public.etl_state WHERE key = %s",
+            (key,)
+        )
         row = cursor.fetchone()
         cursor.close()
         return row[0] if row else None
@@ -32,11 +29,14 @@ class StateManager:
             ON CONFLICT (key) DO UPDATE
             SET value = EXCLUDED.value, updated_at = now()
         """, (key, str(value)))
-        self.conn.commit()
         cursor.close()
 
     def close(self):
-        self.conn.close()
+        """Return the connection to the shared pool"""
+        # pooled connections are reused: restore the transactional default
+        # other callers expect
+        self.conn.autocommit = False
+        putconn(self.conn)
 
 
 # Test
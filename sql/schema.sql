@@ -2,11 +2,29 @@
 -- NHTSA Defect Analysis Schema
 -- ==============================
 
--- 0. Safety: drop analytical artifacts only
-DROP VIEW IF EXISTS vehicle_risk_summary CASCADE;
-DROP TABLE IF EXISTS vehicle_risk_scores CASCADE;
-DROP TABLE IF EXISTS component_analysis CASCADE;
-DROP TABLE IF EXISTS complaint_trends CASCADE;
+-- 0. Safety: re-running this file is non-destructive. Only legacy
+-- CREATE TABLE AS snapshots from the old ETL are dropped; the materialized
+-- views below keep their data, indexes and grants (IF NOT EXISTS), and are
+-- rebuilt in place by REFRESH. To pick up a changed view definition, drop
+-- that view (CASCADE) by hand before re-running.
+DO $$
+DECLARE
+    obj RECORD;
+BEGIN
+    FOR obj IN
+        SELECT c.relname
+        FROM pg_class c
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = 'public'
+          AND c.relkind = 'r'
+          AND c.relname IN (
+              'vehicle_risk_scores', 'component_analysis', 'yearly_trends',
+              'top_recalled_vehicles', 'repeat_offenders', 'component_cost_impact'
+          )
+    LOOP
+        EXECUTE format('DROP TABLE %I CASCADE', obj.relname);
+    END LOOP;
+END $$;
 
 
 
@@ -111,60 +129,84 @@ CREATE TABLE IF NOT EXISTS flat_rcl (
 );
 
 -- 4. Vehicle risk summary view (no data yet if flat_* are empty)
-CREATE VIEW vehicle_risk_summary AS
+-- Each side is counted before the join, so complaints are not multiplied by
+-- recalls and no per-row COUNT(DISTINCT) hash is needed (CMPLID is unique,
+-- CAMPNO is the primary key)
+CREATE OR REPLACE VIEW vehicle_risk_summary AS
+WITH complaints AS (
+    SELECT MAKETXT, MODELTXT, YEARTXT, COUNT(CMPLID) AS total_complaints
+    FROM flat_cmpl
+    WHERE YEARTXT BETWEEN '2010' AND '2025'
+      AND MAKETXT NOT IN ('UNKNOWN', 'FIRESTONE', 'GOODYEAR', 'MICHELIN')
+      AND MODELTXT NOT LIKE '%CHILD SEAT%'
+    GROUP BY MAKETXT, MODELTXT, YEARTXT
+),
+recalls AS (
+    SELECT MAKETXT, MODELTXT, YEARTXT, COUNT(*) AS total_recalls
+    FROM flat_rcl
+    GROUP BY MAKETXT, MODELTXT, YEARTXT
+)
 SELECT
     c.MAKETXT,
     c.MODELTXT,
     c.YEARTXT,
-    COUNT(DISTINCT c.CMPLID) AS total_complaints,
-    COUNT(DISTINCT r.CAMPNO) AS total_recalls
-FROM flat_cmpl c
-LEFT JOIN flat_rcl r
+    c.total_complaints,
+    COALESCE(r.total_recalls, 0) AS total_recalls
+FROM complaints c
+LEFT JOIN recalls r
     ON c.MAKETXT = r.MAKETXT
     AND c.MODELTXT = r.MODELTXT
-    AND c.YEARTXT = r.YEARTXT
-WHERE c.YEARTXT BETWEEN '2010' AND '2025'
-  AND c.MAKETXT NOT IN ('UNKNOWN', 'FIRESTONE', 'GOODYEAR', 'MICHELIN')
-  AND c.MODELTXT NOT LIKE '%CHILD SEAT%'
-GROUP BY c.MAKETXT, c.MODELTXT, c.YEARTXT;
+    AND c.YEARTXT = r.YEARTXT;
 
--- 5. Vehicle risk scores (materialized snapshot)
-DROP TABLE IF EXISTS vehicle_risk_scores CASCADE;
+-- 5. Analytical materialized views
+-- Refreshed by etl/load_postgres.py:refresh_analytical_tables with
+-- REFRESH MATERIALIZED VIEW CONCURRENTLY, which needs a unique index on each.
 
-CREATE TABLE vehicle_risk_scores AS
+-- 5.0 Narrow 2020-2024 complaint base shared by the complaint aggregates
+-- (5b, 5c, 5e, 5f), so a refresh scans flat_cmpl once instead of four times.
+-- Refreshed first, without CONCURRENTLY: only the views below read it.
+CREATE MATERIALIZED VIEW IF NOT EXISTS cmpl_2020_2024 AS
 SELECT
-    MAKETXT,
-    MODELTXT,
-    YEARTXT,
-    total_complaints,
-    total_recalls,
-
-    -- Risk ratio only when recalls exist
-    CASE
-        WHEN total_recalls > 0
-        THEN ROUND(total_complaints::NUMERIC / total_recalls, 1)
-        ELSE NULL
-    END AS risk_ratio,
+    MAKETXT, MODELTXT, YEARTXT, COMPDESC,
+    CRASH, FIRE, INJURED, DEATHS
+FROM flat_cmpl
+WHERE YEARTXT BETWEEN '2020' AND '2024';
 
-    -- Canonical risk classification
+-- 5a. Vehicle risk scores
+CREATE MATERIALIZED VIEW IF NOT EXISTS vehicle_risk_scores AS
+SELECT
+    MAKETXT, MODELTXT, YEARTXT,
+    total_complaints, total_recalls,
+    ROUND(total_complaints::NUMERIC / NULLIF(total_recalls, 0), 1)::NUMERIC(10,1) AS risk_ratio,
     CASE
-        WHEN total_recalls = 0 AND total_complaints >= 300 THEN 'CRITICAL'
-        WHEN total_recalls = 0 AND total_complaints >= 100 THEN 'HIGH'
-        WHEN total_recalls > 0 AND total_complaints::FLOAT / total_recalls >= 100 THEN 'HIGH'
-        WHEN total_recalls > 0 AND total_complaints::FLOAT / total_recalls >= 50 THEN 'MEDIUM'
+        WHEN total_recalls = 0 AND total_complaints > 500 THEN 'CRITICAL'
+        WHEN total_recalls = 0 AND total_complaints > 200 THEN 'HIGH'
+        WHEN total_complaints > total_recalls * 10 THEN 'MEDIUM'
         ELSE 'LOW'
-    END AS risk_category,
-
-    -- Explicit flag for silent recalls
-    CASE
-        WHEN total_recalls = 0 THEN TRUE
-        ELSE FALSE
-    END AS zero_recall_flag
-
+    END AS risk_category
 FROM vehicle_risk_summary
-WHERE total_complaints > 50
+WHERE YEARTXT BETWEEN '2020' AND '2024'
+  AND total_complaints > 50
 ORDER BY total_complaints DESC;
 
+CREATE UNIQUE INDEX IF NOT EXISTS vehicle_risk_scores_key
+    ON vehicle_risk_scores (MAKETXT, MODELTXT, YEARTXT);
+
+-- Partial covering indexes matching the alert predicates
+CREATE INDEX IF NOT EXISTS idx_vrs_high_ratio
+    ON vehicle_risk_scores (risk_ratio DESC)
+    INCLUDE (MAKETXT, MODELTXT, YEARTXT)
+    WHERE total_recalls > 0 AND risk_ratio >= 100;
+CREATE INDEX IF NOT EXISTS idx_vrs_zero_recall
+    ON vehicle_risk_scores (total_complaints DESC)
+    INCLUDE (MAKETXT, MODELTXT, YEARTXT)
+    WHERE total_recalls = 0 AND risk_category IN ('HIGH', 'CRITICAL');
+
+-- Silent Recalls make filter (MAKETXT = ANY(...) ORDER BY total_complaints DESC)
+-- and the DISTINCT MAKETXT dropdown
+CREATE INDEX IF NOT EXISTS idx_vrs_maketxt
+    ON vehicle_risk_scores (MAKETXT, total_complaints DESC);
+
 -- Zero recall - high risk vehicles
 CREATE OR REPLACE VIEW zero_recall_high_risk AS
 SELECT
@@ -174,11 +216,11 @@ SELECT
     total_complaints,
     risk_category
 FROM vehicle_risk_scores
-WHERE zero_recall_flag = TRUE
+WHERE total_recalls = 0
 ORDER BY total_complaints DESC;
 
--- 6. Component Pareto snapshot
-CREATE TABLE component_analysis AS
+-- 5b. Component Pareto
+CREATE MATERIALIZED VIEW IF NOT EXISTS component_analysis AS
 SELECT
     COMPDESC,
     COUNT(*) AS total_complaints,
@@ -186,15 +228,132 @@ SELECT
     SUM(CASE WHEN FIRE = 'Y' THEN 1 ELSE 0 END) AS fire_related,
     SUM(INJURED) AS total_injuries,
     SUM(DEATHS) AS total_deaths
-FROM flat_cmpl
-WHERE YEARTXT BETWEEN '2015' AND '2024'
-  AND MAKETXT NOT IN ('UNKNOWN', 'FIRESTONE', 'GOODYEAR')
+FROM cmpl_2020_2024
+WHERE MAKETXT NOT IN ('UNKNOWN', 'FIRESTONE', 'GOODYEAR')
 GROUP BY COMPDESC
 ORDER BY total_complaints DESC
 LIMIT 50;
 
--- 7. Complaint trends snapshot
-CREATE TABLE complaint_trends AS
+CREATE UNIQUE INDEX IF NOT EXISTS component_analysis_key ON component_analysis (COMPDESC);
+
+-- 5c. Time series by model year
+CREATE MATERIALIZED VIEW IF NOT EXISTS yearly_trends AS
+SELECT
+    YEARTXT AS year,
+    COUNT(*) AS total_complaints,
+    SUM(CASE WHEN CRASH = 'Y' THEN 1 ELSE 0 END) AS crashes,
+    SUM(CASE WHEN FIRE = 'Y' THEN 1 ELSE 0 END) AS fires,
+    SUM(INJURED) AS injuries,
+    SUM(DEATHS) AS deaths
+FROM cmpl_2020_2024
+GROUP BY YEARTXT
+ORDER BY YEARTXT;
+
+CREATE UNIQUE INDEX IF NOT EXISTS yearly_trends_key ON yearly_trends (year);
+
+-- 5d. Top recalled vehicles
+CREATE MATERIALIZED VIEW IF NOT EXISTS top_recalled_vehicles AS
+SELECT
+    MAKETXT,
+    MODELTXT,
+    YEARTXT,
+    COUNT(*) AS recall_count,
+    SUM(POTAFF) AS total_units_affected
+FROM flat_rcl
+WHERE YEARTXT BETWEEN '2020' AND '2024'
+GROUP BY MAKETXT, MODELTXT, YEARTXT
+HAVING COUNT(*) > 1
+ORDER BY recall_count DESC
+LIMIT 100;
+
+CREATE UNIQUE INDEX IF NOT EXISTS top_recalled_vehicles_key
+    ON top_recalled_vehicles (MAKETXT, MODELTXT, YEARTXT);
+
+-- 5e. Repeat offender vehicles (persistent top-complaint models)
+CREATE MATERIALIZED VIEW IF NOT EXISTS repeat_offenders AS
+WITH yearly_aggregates AS (
+    SELECT
+        MAKETXT,
+        MODELTXT,
+        YEARTXT,
+        COUNT(*) AS complaints
+    FROM cmpl_2020_2024
+    GROUP BY MAKETXT, MODELTXT, YEARTXT
+),
+yearly_rankings AS (
+    SELECT
+        MAKETXT,
+        MODELTXT,
+        YEARTXT,
+        complaints,
+        ROW_NUMBER() OVER (
+            PARTITION BY YEARTXT
+            ORDER BY complaints DESC
+        ) AS rank_in_year
+    FROM yearly_aggregates
+)
+SELECT
+    MAKETXT,
+    MODELTXT,
+    COUNT(DISTINCT YEARTXT) AS years_in_top10,
+    SUM(complaints) AS total_complaints,
+    STRING_AGG(YEARTXT, ',' ORDER BY YEARTXT) AS problem_years
+FROM yearly_rankings
+WHERE rank_in_year <= 10
+GROUP BY MAKETXT, MODELTXT
+HAVING COUNT(DISTINCT YEARTXT) >= 3
+ORDER BY years_in_top10 DESC, total_complaints DESC;
+
+CREATE UNIQUE INDEX IF NOT EXISTS repeat_offenders_key ON repeat_offenders (MAKETXT, MODELTXT);
+
+-- 5f. Component cost impact (economic + injury burden)
+CREATE MATERIALIZED VIEW IF NOT EXISTS component_cost_impact AS
+WITH component_costs AS (
+    SELECT
+        COMPDESC,
+        COUNT(*) AS total_complaints,
+        SUM(CASE WHEN CRASH = 'Y' THEN 1 ELSE 0 END) AS crash_count,
+        SUM(INJURED) AS total_injuries,
+        (
+            COUNT(*) * 5000
+            + SUM(CASE WHEN CRASH = 'Y' THEN 1 ELSE 0 END) * 50000
+            + SUM(INJURED) * 100000
+        )::BIGINT AS estimated_cost
+    FROM cmpl_2020_2024
+    WHERE MAKETXT NOT IN ('UNKNOWN', 'FIRESTONE', 'GOODYEAR')
+    GROUP BY COMPDESC
+)
+SELECT
+    COMPDESC,
+    total_complaints,
+    crash_count,
+    total_injuries,
+    estimated_cost,
+    (estimated_cost * 0.10)::BIGINT AS savings_if_reduced_10pct
+FROM component_costs
+ORDER BY estimated_cost DESC
+LIMIT 50;
+
+CREATE UNIQUE INDEX IF NOT EXISTS component_cost_impact_key ON component_cost_impact (COMPDESC);
+
+-- 5g. Dashboard headline counts, one row, rebuilt after the views above
+CREATE MATERIALIZED VIEW IF NOT EXISTS etl_metrics AS
+SELECT
+    1 AS id,
+    (SELECT COUNT(*) FROM flat_rcl) AS total_recalls,
+    (SELECT COUNT(*) FROM flat_cmpl) AS total_complaints,
+    (SELECT COUNT(*) FROM vehicle_risk_scores) AS vehicles_tracked,
+    (SELECT COUNT(*) FROM vehicle_risk_scores
+     WHERE risk_category IN ('HIGH','CRITICAL')) AS high_risk_vehicles,
+    (SELECT COUNT(*) FROM vehicle_risk_scores
+     WHERE total_recalls = 0
+       AND risk_category IN ('HIGH','CRITICAL')) AS zero_recall_high_risk,
+    now() AS refreshed_at;
+
+CREATE UNIQUE INDEX IF NOT EXISTS etl_metrics_key ON etl_metrics (id);
+
+-- 6. Complaint trends snapshot (static export source, not refreshed by the ETL)
+CREATE TABLE IF NOT EXISTS complaint_trends AS
 SELECT
     MAKETXT,
     MODELTXT,
@@ -209,10 +368,20 @@ WHERE YEARTXT BETWEEN '2015' AND '2024'
 GROUP BY MAKETXT, MODELTXT, YEARTXT, complaint_year, complaint_quarter
 ORDER BY complaint_year DESC, complaint_quarter DESC;
 
--- Add seen campaign numbers tracking
-INSERT INTO etl_state (key, value, updated_at)
-VALUES ('seen_campaign_numbers', '[]', now())
-ON CONFLICT (key) DO NOTHING;
+-- Seen recall campaigns (dedupe for the recall API fetch)
+CREATE TABLE IF NOT EXISTS seen_campaigns (
+    campaign_number TEXT PRIMARY KEY,
+    first_seen TIMESTAMPTZ DEFAULT now()
+);
+
+-- One-time backfill from the legacy JSON list in etl_state
+INSERT INTO seen_campaigns (campaign_number)
+SELECT json_array_elements_text(value::json)
+FROM etl_state
+WHERE key = 'seen_campaign_numbers'
+ON CONFLICT DO NOTHING;
+
+DELETE FROM etl_state WHERE key = 'seen_campaign_numbers';
 
 
 -- Alert State Table
@@ -233,4 +402,49 @@ BEGIN
         ALTER TABLE flat_cmpl
         ADD CONSTRAINT flat_cmpl_cmplid_unique UNIQUE (CMPLID);
     END IF;
-END $$;
\ No newline at end of file
+END $$;
+
+-- complaint dedupe now relies on flat_cmpl_cmplid_unique; drop the old JSON blob
+DELETE FROM etl_state WHERE key = 'seen_odi_numbers';
+
+-- 7. Top complaint vehicles (recall fetch targets), refreshed after each complaint ingest
+CREATE MATERIALIZED VIEW IF NOT EXISTS top_complaint_vehicles_mv AS
+SELECT
+    MAKETXT AS make,
+    MODELTXT AS model,
+    YEARTXT AS year,
+    COUNT(*) AS complaint_count
+FROM flat_cmpl
+WHERE YEARTXT BETWEEN '2015' AND '2024'
+  AND MAKETXT NOT IN ('UNKNOWN', 'FIRESTONE', 'GOODYEAR')
+  AND MODELTXT != 'UNKNOWN'
+GROUP BY MAKETXT, MODELTXT, YEARTXT
+HAVING COUNT(*) > 50;
+
+-- unique index is required by REFRESH ... CONCURRENTLY
+CREATE UNIQUE INDEX IF NOT EXISTS top_complaint_vehicles_mv_key
+    ON top_complaint_vehicles_mv (make, model, year);
+CREATE INDEX IF NOT EXISTS top_complaint_vehicles_mv_count
+    ON top_complaint_vehicles_mv (complaint_count DESC);
+
+-- 8. Load watermarks: refresh_analytical_tables skips the rebuild when no
+-- complaint or recall has been loaded since last_analytics_refresh
+ALTER TABLE flat_cmpl ADD COLUMN IF NOT EXISTS loaded_at TIMESTAMP DEFAULT now();
+ALTER TABLE flat_rcl ADD COLUMN IF NOT EXISTS loaded_at TIMESTAMP DEFAULT now();
+-- New rows take the insert's wall-clock time: now() is when the loading
+-- transaction began, so a load that overlapped a refresh could commit rows
+-- at or below the stored watermark and never trigger another refresh
+ALTER TABLE flat_cmpl ALTER COLUMN loaded_at SET DEFAULT clock_timestamp();
+ALTER TABLE flat_rcl ALTER COLUMN loaded_at SET DEFAULT clock_timestamp();
+CREATE INDEX IF NOT EXISTS idx_cmpl_loaded_at ON flat_cmpl (loaded_at);
+CREATE INDEX IF NOT EXISTS idx_rcl_loaded_at ON flat_rcl (loaded_at);
+
+-- 9. Covering index for the recall side of the analytical refreshes, so
+-- REFRESH can read from the index (index-only scans once the visibility map
+-- is current) instead of the wide raw rows. The complaint side reads the
+-- narrow cmpl_2020_2024 view (5.0) instead: a covering index on flat_cmpl
+-- would store yet another copy of the same complaints
+DROP INDEX IF EXISTS idx_cmpl_year_covering;
+CREATE INDEX IF NOT EXISTS idx_rcl_year_maker
+    ON flat_rcl (YEARTXT, MAKETXT, MODELTXT)
+    INCLUDE (POTAFF);
@@ -1,16 +1,16 @@
 import streamlit as st
 import pandas as pd
-import psycopg2
+from sqlalchemy import create_engine
 import plotly.express as px
 import plotly.graph_objects as go
 import os
+from decimal import Decimal
 from dotenv import load_dotenv
 from pathlib import Path
 
-# Load env
+# Local .env (absent on Streamlit Cloud, which uses st.secrets)
 project_root = Path(__file__).parent.parent
 env_path = project_root / ".env"
-load_dotenv(dotenv_path=env_path)
 
 # Page config
 st.set_page_config(
@@ -22,14 +22,346 @@ st.set_page_config(
 
 # Database connection
 @st.cache_resource
-def get_connection_factory():
+def get_engine():
+    # runs once per process, not on every rerun
+    if env_path.exists():
+        load_dotenv(dotenv_path=env_path)
     db_url = os.getenv("SUPABASE_DB_URL") or st.secrets.get("SUPABASE_DB_URL")
     if not db_url:
         st.error("SUPABASE_DB_URL not configured")
         st.stop()
-    return lambda: psycopg2.connect(db_url)
+    # SQLAlchemy only accepts the postgresql:// scheme
+    if db_url.startswith("postgres://"):
+        db_url = "postgresql://" + db_url[len("postgres://"):]
+    # pre-ping and recycle replace connections Supabase has dropped while idle
+    return create_engine(
+        db_url,
+        pool_size=5,
+        max_overflow=2,
+        pool_pre_ping=True,
+        pool_recycle=300,
+    )
+
+engine = get_engine()
+
+
+STREAM_BATCH = 5000
+MAKES_RISK_LIMIT = 500     # Silent Recalls rows per make shipped unless "Show all"
+SCATTER_PER_MAKE = 50      # most-complained vehicles plotted per make
+
+
+def _shrink(df):
+    """Narrow numeric columns before they are serialized to the browser"""
+    for c in df.columns:
+        col = df[c]
+        if col.dtype == object:
+            # NUMERIC sums arrive as Decimal objects; store them as floats
+            first = col.dropna()[:1]
+            if len(first) and isinstance(first.iloc[0], Decimal):
+                df[c] = col.astype("float64")
+        elif pd.api.types.is_integer_dtype(col):
+            df[c] = pd.to_numeric(col, downcast="integer")
+    return df
+
+
+def _query_df(sql, params=None, one_indexed=True, cursor_name=None):
+    """Run a query on a pooled connection and build the DataFrame straight from the cursor
+
+    Pass cursor_name for unbounded result sets: a server-side cursor makes
+    Postgres stream the rows in STREAM_BATCH chunks instead of buffering
+    the whole result client-side first.
+    """
+    # raw DBAPI connection from the engine's pool; close() hands it back
+    # (rolled back)
+    conn = engine.raw_connection()
+    try:
+        with conn.cursor(name=cursor_name) as cur:
+            if cursor_name:
+                cur.itersize = STREAM_BATCH
+            cur.execute(sql, params)
+            rows = []
+            while True:
+                batch = cur.fetchmany(STREAM_BATCH)
+                if not batch:
+                    break
+                rows.extend(batch)
+            df = pd.DataFrame(rows, columns=[d[0] for d in cur.description])
+    finally:
+        conn.close()
+    if one_indexed:
+        df.index = df.index + 1
+    return _shrink(df)
+
+
+# ======================
+# Queries
+# ======================
+
+SQL_ETL_STATUS = """
+SELECT key, value, updated_at
+FROM etl_state
+WHERE key IN ('last_recall_fetch', 'total_recalls_loaded')
+ORDER BY key
+"""
+
+SQL_MAKES = """
+SELECT DISTINCT MAKETXT FROM vehicle_risk_scores ORDER BY MAKETXT
+"""
+
+SQL_MAKES_RISK = """
+SELECT make, model, year, total_complaints, total_recalls, risk_category, make_rank
+FROM (
+    SELECT
+        MAKETXT AS make,
+        MODELTXT AS model,
+        YEARTXT AS year,
+        total_complaints,
+        total_recalls,
+        risk_category,
+        ROW_NUMBER() OVER (
+            PARTITION BY MAKETXT ORDER BY total_complaints DESC
+        ) AS make_rank
+    FROM vehicle_risk_scores
+    WHERE MAKETXT = ANY(%s)
+) ranked
+WHERE make_rank <= COALESCE(%s, make_rank)
+ORDER BY total_complaints DESC
+"""
+
+SQL_OVERVIEW = """
+SELECT
+    total_recalls,
+    total_complaints,
+    vehicles_tracked,
+    high_risk_vehicles,
+    zero_recall_high_risk,
+    refreshed_at
+FROM etl_metrics
+"""
+
+SQL_TOP_RISK = """
+SELECT
+    MAKETXT AS make,
+    MODELTXT AS model,
+    YEARTXT AS year,
+    total_complaints,
+    total_recalls,
+    risk_ratio,
+    risk_category
+FROM vehicle_risk_scores
+WHERE total_recalls > 0
+ORDER BY risk_ratio DESC
+"""
+
+SQL_ZERO_RECALL = """
+SELECT
+    MAKETXT AS make,
+    MODELTXT AS model,
+    YEARTXT AS year,
+    total_complaints,
+    risk_category
+FROM vehicle_risk_scores
+WHERE total_recalls = 0
+  AND risk_category IN ('HIGH','CRITICAL')
+ORDER BY total_complaints DESC
+"""
+
+SQL_REPEAT_OFFENDERS = """
+SELECT
+    MAKETXT AS make,
+    MODELTXT AS model,
+    years_in_top10,
+    total_complaints,
+    problem_years
+FROM repeat_offenders
+ORDER BY years_in_top10 DESC, total_complaints DESC
+"""
+
+SQL_COMPONENT_COST = """
+SELECT
+    COMPDESC AS component,
+    total_complaints,
+    crash_count,
+    total_injuries,
+    estimated_cost,
+    savings_if_reduced_10pct
+FROM component_cost_impact
+ORDER BY estimated_cost DESC
+"""
+
+
+# ======================
+# Helper functions
+# ======================
+
+@st.cache_data(ttl=300)
+def load_etl_status():
+    return _query_df(SQL_ETL_STATUS)
+
+
+@st.cache_data(ttl=3600)
+def load_makes():
+    # only changes when the weekly ETL refreshes vehicle_risk_scores
+    return _query_df(SQL_MAKES)["maketxt"].tolist()
+
+
+@st.cache_data(ttl=600)
+def load_makes_risk(makes, show_all=False):
+    """Risk rows for the selected makes (a sorted tuple, so the cache key is stable)"""
+    # the cap is per make, so one big make can't crowd out the others;
+    # a NULL cap keeps every row, so "Show all" reuses the same SQL text
+    limit = None if show_all else MAKES_RISK_LIMIT
+    # only an uncapped result is worth a server-side cursor; a capped one
+    # comes back in a single round-trip instead of DECLARE/FETCH/CLOSE
+    return _query_df(
+        SQL_MAKES_RISK,
+        params=(list(makes), limit),
+        cursor_name="c_make_filter" if show_all else None
+    )
+
+
+def _bundle(parts):
+    """Fetch several result sets in one round-trip: one JSON array per part"""
+    sql = "\nUNION ALL\n".join(
+        f"SELECT '{kind}' AS kind, (SELECT json_agg(t) FROM ({query}) t) AS rows"
+        for kind, query in parts.items()
+    )
+    bundle = _query_df(sql, one_indexed=False)
+    frames = {}
+    for kind, rows in zip(bundle["kind"], bundle["rows"]):
+        df = pd.DataFrame(rows or [])
+        df.index = df.index + 1
+        frames[kind] = _shrink(df)
+    return frames
+
+
+@st.cache_data(ttl=600)
+def load_overview_bundle():
+    # metrics are precomputed by the ETL refresh (etl_metrics materialized view)
+    return _bundle(
+        {
+            "metrics": SQL_OVERVIEW,
+            "top_risk": SQL_TOP_RISK,
+            "zero_recall": SQL_ZERO_RECALL,
+        }
+    )
+
+
+@st.cache_data(ttl=600)
+def load_systemic_bundle():
+    return _bundle(
+        {
+            "repeat_offenders": SQL_REPEAT_OFFENDERS,
+            "component_cost": SQL_COMPONENT_COST,
+        }
+    )
+
+
+# ======================
+# Figures
+# ======================
+# Built once per distinct input frame and cached as plain dicts, so a rerun
+# hands Streamlit the same figure JSON and the chart updates in place
+
+@st.cache_data(ttl=600)
+def top_risk_figure(refreshed_at):
+    # keyed on the bundle's etl_metrics refresh time rather than its frame:
+    # a new snapshot gets a new figure, and reruns skip hashing the frame
+    fig = px.bar(
+        load_overview_bundle()["top_risk"],
+        x="model",
+        y="risk_ratio",
+        color="risk_category",
+        hover_data=["make", "year", "total_complaints", "total_recalls"],
+        title="Complaints per Recall (Higher = Worse)",
+        color_discrete_map={
+            'CRITICAL': '#ff4444',
+            'HIGH': '#ff8800',
+            'MEDIUM': '#ffbb33',
+            'LOW': '#00C851'
+        }
+    )
+
+    return fig.to_dict()
+
+
+@st.cache_data(ttl=600)
+def makes_scatter_figure(makes, show_all=False):
+    # keyed on the selection tuple rather than the frame it loads
+    df = load_makes_risk(makes, show_all)
+    fig = px.scatter(
+        df[df["make_rank"] <= SCATTER_PER_MAKE],
+        x="total_recalls",
+        y="total_complaints",
+        size="total_complaints",
+        color="risk_category",
+        hover_data=["make", "model", "year"],
+        title="Complaints vs Recalls"
+    )
+
+    return fig.to_dict()
+
+
+@st.cache_data(ttl=600)
+def component_cost_figure(df):
+    fig = px.bar(
+        df.head(15),
+        x="component",
+        y="estimated_cost",
+        hover_data=[
+            "total_complaints",
+            "crash_count",
+            "total_injuries",
+            "savings_if_reduced_10pct"
+        ],
+        title="Top Components by Estimated Safety Cost (2020–2024)",
+        labels={"estimated_cost": "Estimated Cost ($)"}
+    )
+
+    fig.update_layout(
+        xaxis_title="Component",
+        yaxis_title="Estimated Cost ($)",
+        height=500
+    )
+
+    return fig.to_dict()
+
+
+@st.cache_data(ttl=600)
+def pareto_figure(df):
+    fig = go.Figure()
+    fig.add_bar(
+        x=df.component,
+        y=df.total_complaints,
+        name="Total Complaints"
+    )
+    fig.add_scatter(
+        x=df.component,
+        y=df.cumulative_pct,
+        name="Cumulative %",
+        yaxis="y2"
+    )
+    fig.update_layout(
+        yaxis2=dict(overlaying="y", side="right", title="Cumulative %"),
+        legend=dict(title="Metric"),
+        title="Component Pareto Chart"
+    )
+
+    return fig.to_dict()
+
+
+@st.cache_data(ttl=600)
+def trends_figure(df):
+    fig = px.line(
+        df,
+        x="year",
+        y=["total_complaints", "crashes", "fires"],
+        title="Yearly Complaint Trends",
+        labels={"value": "Count", "variable": "Category"}
+    )
+
+    return fig.to_dict()
 
-conn_factory = get_connection_factory()
 
 # Sidebar
 st.sidebar.title("🚗 NHTSA Dashboard")
@@ -51,142 +383,25 @@ st.sidebar.markdown("### Data Freshness")
 
 # ETL status
 try:
-    with conn_factory() as conn:
-        etl_status = pd.read_sql(
-            """
-            SELECT key, value, updated_at
-            FROM etl_state
-            WHERE key IN ('last_recall_fetch', 'total_recalls_loaded')
-            ORDER BY key
-            """,
-            conn
-        )
-    for _, row in etl_status.iterrows():
-        st.sidebar.metric(row["key"], row["value"])
+    status = load_etl_status().set_index("key")["value"]
+    st.sidebar.metric("Last ETL Run", status.get("last_recall_fetch", "—"))
+    st.sidebar.metric("Recalls Tracked", status.get("total_recalls_loaded", "—"))
 except Exception:
     st.sidebar.warning("ETL status unavailable")
 
 st.sidebar.caption("Automated via GitHub Actions • Weekly")
 
-# ======================
-# Helper functions
-# ======================
-
-@st.cache_data(ttl=600)
-def load_overview_metrics():
-    with conn_factory() as conn:
-        return pd.read_sql(
-            """
-            SELECT
-                (SELECT COUNT(*) FROM flat_rcl) AS total_recalls,
-                (SELECT COUNT(*) FROM flat_cmpl) AS total_complaints,
-                (SELECT COUNT(*) FROM vehicle_risk_scores) AS vehicles_tracked,
-                (SELECT COUNT(*) FROM vehicle_risk_scores
-                 WHERE risk_category IN ('HIGH','CRITICAL')) AS high_risk_vehicles,
-                (SELECT COUNT(*) FROM vehicle_risk_scores
-                 WHERE total_recalls = 0
-                   AND risk_category IN ('HIGH','CRITICAL')) AS zero_recall_high_risk
-            """,
-            conn
-        ).iloc[0]
-
-@st.cache_data(ttl=600)
-def load_top_risk():
-    with conn_factory() as conn:
-        df = pd.read_sql(
-            """
-            SELECT
-                MAKETXT AS make,
-                MODELTXT AS model,
-                YEARTXT AS year,
-                total_complaints,
-                total_recalls,
-                ROUND((total_complaints::FLOAT / NULLIF(total_recalls, 0))::NUMERIC, 1) AS risk_ratio,
-                risk_category
-            FROM vehicle_risk_scores
-            WHERE total_recalls > 0
-            ORDER BY risk_ratio DESC
-            """,
-            conn
-        )
-    df = df.reset_index(drop=True)
-    df.index = df.index + 1
-    return df
-
-@st.cache_data(ttl=600)
-def load_zero_recall():
-    with conn_factory() as conn:
-        df = pd.read_sql(
-            """
-            SELECT
-                MAKETXT AS make,
-                MODELTXT AS model,
-                YEARTXT AS year,
-                total_complaints,
-                risk_category
-            FROM vehicle_risk_scores
-            WHERE total_recalls = 0
-              AND risk_category IN ('HIGH','CRITICAL')
-            ORDER BY total_complaints DESC
-            """,
-            conn
-        )
-    df = df.reset_index(drop=True)
-    df.index = df.index + 1
-    return df
-
-@st.cache_data(ttl=600)
-def load_repeat_offenders():
-    with conn_factory() as conn:
-        df = pd.read_sql(
-            """
-            SELECT
-                MAKETXT AS make,
-                MODELTXT AS model,
-                years_in_top10,
-                total_complaints,
-                problem_years
-            FROM repeat_offenders
-            ORDER BY years_in_top10 DESC, total_complaints DESC
-            """,
-            conn
-        )
-    df = df.reset_index(drop=True)
-    df.index = df.index + 1
-    return df
-
-
-@st.cache_data(ttl=600)
-def load_component_cost_impact():
-    with conn_factory() as conn:
-        df = pd.read_sql(
-            """
-            SELECT
-                COMPDESC AS component,
-                total_complaints,
-                crash_count,
-                total_injuries,
-                estimated_cost,
-                savings_if_reduced_10pct
-            FROM component_cost_impact
-            ORDER BY estimated_cost DESC
-            """,
-            conn
-        )
-    df = df.reset_index(drop=True)
-    df.index = df.index + 1
-    return df
-
-
 # ======================
 # Pages
 # ======================
 
-if page == "🏠 Overview":
+@st.fragment
+def overview_page():
     st.title("🚗 NHTSA Silent Recall Analysis")
     st.markdown("**Detecting vehicles with unusually high complaints relative to recalls**")
 
-    m = load_overview_metrics()
+    overview = load_overview_bundle()
+    m = overview["metrics"].iloc[0]
     c1, c2, c3, c4, c5 = st.columns(5)
 
     c1.metric("Total Recalls", f"{m.total_recalls:,}")
@@ -206,7 +421,7 @@ if page == "🏠 Overview":
     st.markdown("---")
     st.subheader("🚨 Zero-Recall High-Risk Vehicles")
 
-    zr = load_zero_recall()
+    zr = overview["zero_recall"]
     if zr.empty:
         st.success("No zero-recall high-risk vehicles detected.")
     else:
@@ -216,71 +431,37 @@ if page == "🏠 Overview":
     st.markdown("---")
     st.subheader("🧨 Top Silent Recall Candidates")
 
-    top_risk = load_top_risk()
+    top_risk = overview["top_risk"]
 
-    fig = px.bar(
-        top_risk,
-        x="model",
-        y="risk_ratio",
-        color="risk_category",
-        hover_data=["make", "year", "total_complaints", "total_recalls"],
-        title="Complaints per Recall (Higher = Worse)",
-        color_discrete_map={
-            'CRITICAL': '#ff4444',
-            'HIGH': '#ff8800',
-            'MEDIUM': '#ffbb33',
-            'LOW': '#00C851'
-        }
-    )
-    st.plotly_chart(fig, use_container_width=True)
-    st.dataframe(top_risk, use_container_width=True)
+    if top_risk.empty:
+        st.info("No recalled vehicles scored yet.")
+    else:
+        st.plotly_chart(top_risk_figure(m.refreshed_at), use_container_width=True, key="top_risk_fig")
+        st.dataframe(top_risk, use_container_width=True)
 
-elif page == "🚨 Silent Recalls":
+
+@st.fragment
+def silent_recalls_page():
     st.title("🚨 Silent Recalls Detector")
 
-    with conn_factory() as conn:
-        makes = pd.read_sql(
-            "SELECT DISTINCT MAKETXT FROM vehicle_risk_scores ORDER BY MAKETXT",
-            conn
-        )["maketxt"].tolist()
+    makes = load_makes()
 
     selected_makes = st.multiselect("Select Manufacturers", makes, default=makes[:5])
 
     if selected_makes:
-        placeholders = ",".join(["%s"] * len(selected_makes))
-        with conn_factory() as conn:
-            df = pd.read_sql(
-                f"""
-                SELECT
-                    MAKETXT AS make,
-                    MODELTXT AS model,
-                    YEARTXT AS year,
-                    total_complaints,
-                    total_recalls,
-                    risk_category
-                FROM vehicle_risk_scores
-                WHERE MAKETXT IN ({placeholders})
-                ORDER BY total_complaints DESC
-                """,
-                conn,
-                params=selected_makes
-            )
-
-        df = df.reset_index(drop=True)
-        df.index = df.index + 1
-
-        fig = px.scatter(
-            df,
-            x="total_recalls",
-            y="total_complaints",
-            size="total_complaints",
-            color="risk_category",
-            hover_data=["make", "model", "year"],
-            title="Complaints vs Recalls"
+        show_all = st.checkbox(
+            "Show all",
+            help=f"By default only the {MAKES_RISK_LIMIT} most-complained vehicles per make are listed"
         )
+        selection = tuple(sorted(selected_makes))
+        df = load_makes_risk(selection, show_all)
 
-        st.plotly_chart(fig, use_container_width=True)
-        st.dataframe(df, use_container_width=True)
+        st.plotly_chart(
+            makes_scatter_figure(selection, show_all),
+            use_container_width=True,
+            key="makes_scatter_fig"
+        )
+        st.dataframe(df.drop(columns="make_rank"), use_container_width=True)
 
     else:
         st.warning("Select at least one manufacturer")
@@ -288,24 +469,19 @@ elif page == "🚨 Silent Recalls":
     st.markdown("---")
     st.subheader("📦 Vehicles With Multiple Recalls (Manufacturer Acknowledged Issues)")
 
-    with conn_factory() as conn:
-        trv = pd.read_sql(
-            """
-            SELECT
-                MAKETXT AS make,
-                MODELTXT AS model,
-                YEARTXT AS year,
-                recall_count,
-                total_units_affected
-            FROM top_recalled_vehicles
-            ORDER BY recall_count DESC
-            LIMIT 20
-            """,
-            conn
-        )
-
-    trv = trv.reset_index(drop=True)
-    trv.index = trv.index + 1
+    trv = _query_df(
+        """
+        SELECT
+            MAKETXT AS make,
+            MODELTXT AS model,
+            YEARTXT AS year,
+            recall_count,
+            total_units_affected
+        FROM top_recalled_vehicles
+        ORDER BY recall_count DESC
+        LIMIT 20
+        """
+    )
 
     st.caption(
         "These vehicles have multiple official recalls, indicating acknowledged safety action "
@@ -314,7 +490,8 @@ elif page == "🚨 Silent Recalls":
     st.dataframe(trv, use_container_width=True)
 
 
-elif page == "🧠 Systemic Risk":
+@st.fragment
+def systemic_risk_page():
     st.title("🧠 Systemic Safety Risk Analysis")
     st.markdown(
         """
@@ -331,7 +508,8 @@ elif page == "🧠 Systemic Risk":
         "Vehicles that ranked in the **top 10 complaint volume** for at least **3 different years** (2020–2024)."
     )
 
-    repeat_df = load_repeat_offenders()
+    systemic = load_systemic_bundle()
+    repeat_df = systemic["repeat_offenders"]
 
     if repeat_df.empty:
         st.info("No repeat offenders detected for this period.")
@@ -351,32 +529,12 @@ elif page == "🧠 Systemic Risk":
         "Estimated economic and injury burden based on complaint volume, crashes, and injuries."
     )
 
-    cost_df = load_component_cost_impact()
+    cost_df = systemic["component_cost"]
 
     if cost_df.empty:
         st.info("No component cost data available.")
     else:
-        fig = px.bar(
-            cost_df.head(15),
-            x="component",
-            y="estimated_cost",
-            hover_data=[
-                "total_complaints",
-                "crash_count",
-                "total_injuries",
-                "savings_if_reduced_10pct"
-            ],
-            title="Top Components by Estimated Safety Cost (2020–2024)",
-            labels={"estimated_cost": "Estimated Cost ($)"}
-        )
-
-        fig.update_layout(
-            xaxis_title="Component",
-            yaxis_title="Estimated Cost ($)",
-            height=500
-        )
-
-        st.plotly_chart(fig, use_container_width=True)
+        st.plotly_chart(component_cost_figure(cost_df), use_container_width=True, key="component_cost_fig")
         st.dataframe(cost_df, use_container_width=True)
 
     st.markdown(
@@ -388,13 +546,27 @@ elif page == "🧠 Systemic Risk":
     )
 
 
-
-elif page == "📊 Components":
+@st.fragment
+def components_page():
     st.title("📊 Component Failure Analysis")
 
-    with conn_factory() as conn:
-        df = pd.read_sql(
-            """
+    # cumulative share is over the 20 components shown, as in a Pareto chart
+    df = _query_df(
+        """
+        SELECT
+            component,
+            total_complaints,
+            crash_related,
+            fire_related,
+            total_injuries,
+            ROUND(
+                SUM(total_complaints) OVER (
+                    ORDER BY total_complaints DESC, component
+                    ROWS UNBOUNDED PRECEDING
+                ) * 100.0 / SUM(total_complaints) OVER (),
+                1
+            ) AS cumulative_pct
+        FROM (
             SELECT
                 COMPDESC AS component,
                 total_complaints,
@@ -402,67 +574,49 @@ elif page == "📊 Components":
                 fire_related,
                 total_injuries
             FROM component_analysis
-            ORDER BY total_complaints DESC
+            ORDER BY total_complaints DESC, COMPDESC
             LIMIT 20
-            """,
-            conn
-        )
-
-    df = df.reset_index(drop=True)
-    df.index = df.index + 1
-
-    fig = go.Figure()
-    fig.add_bar(
-        x=df.component,
-        y=df.total_complaints,
-        name="Total Complaints"
-    )
-    fig.add_scatter(
-        x=df.component,
-        y=df.total_complaints.cumsum() / df.total_complaints.sum() * 100,
-        name="Cumulative %",
-        yaxis="y2"
-    )
-    fig.update_layout(
-        yaxis2=dict(overlaying="y", side="right", title="Cumulative %"),
-        legend=dict(title="Metric"),
-        title="Component Pareto Chart"
+        ) top
+        ORDER BY total_complaints DESC, component
+        """
     )
 
-    st.plotly_chart(fig, use_container_width=True)
+    st.plotly_chart(pareto_figure(df), use_container_width=True, key="pareto_fig")
     st.dataframe(df, use_container_width=True)
 
-elif page == "📈 Trends":
-    st.title("📈 Complaint Trends Over Time")
 
-    with conn_factory() as conn:
-        trends = pd.read_sql(
-            """
-            SELECT 
-                year,
-                total_complaints,
-                crashes,
-                fires,
-                injuries,
-                deaths
-            FROM yearly_trends
-            ORDER BY year
-            """,
-            conn
-        )
-
-    trends = trends.reset_index(drop=True)
-    trends.index = trends.index + 1
+@st.fragment
+def trends_page():
+    st.title("📈 Complaint Trends Over Time")
 
-    fig = px.line(
-        trends,
-        x="year",
-        y=["total_complaints", "crashes", "fires"],
-        title="Yearly Complaint Trends",
-        labels={"value": "Count", "variable": "Category"}
+    trends = _query_df(
+        """
+        SELECT 
+            year,
+            total_complaints,
+            crashes,
+            fires,
+            injuries,
+            deaths
+        FROM yearly_trends
+        ORDER BY year
+        """
     )
-    st.plotly_chart(fig, use_container_width=True)
+
+    st.plotly_chart(trends_figure(trends), use_container_width=True, key="trends_fig")
     st.dataframe(trends, use_container_width=True)
 
+
+# Each page is a fragment: its own widgets (e.g. the make multiselect) rerun
+# just that page, not the sidebar and the rest of the script
+PAGES = {
+    "🏠 Overview": overview_page,
+    "🚨 Silent Recalls": silent_recalls_page,
+    "🧠 Systemic Risk": systemic_risk_page,
+    "📊 Components": components_page,
+    "📈 Trends": trends_page,
+}
+PAGES[page]()
+
 st.markdown("---")
 st.caption("NHTSA • Supabase PostgreSQL • GitHub Actions • Streamlit")
\ No newline at end of file